@@ -1,4 +1,5 @@
 import random
+from functools import lru_cache
 from typing import Iterable, List, Union, Optional
 from pyheart.exceptions import (
     DeadCardError,
@@ -11,10 +12,23 @@ from pyheart.mixins import UniqueIdentifierMixin
 
 
 class Ability:
+    _instances = {}
+
+    def __new__(cls, value: int = None, allow_target: bool = False):
+        # abilities are immutable configuration, so equal ones are shared between cards
+        key = (cls, value, allow_target)
+        ability = Ability._instances.get(key)
+        if ability is None:
+            ability = Ability._instances[key] = super(Ability, cls).__new__(cls)
+        return ability
+
     def __init__(self, value: int = None, allow_target: bool = False):
         self._val = value
         self.can_target = allow_target
 
+    def __reduce__(self) -> tuple:
+        return self.__class__, (self._val, self.can_target)
+
     def apply(self, card: 'Card', phase_name: str, **kwargs):
         phase_method_name = f'_{phase_name}_phase'
         getattr(self, phase_method_name, self.__default_method)(card=card, **kwargs)
@@ -26,6 +40,10 @@ class Ability:
     def __default_method(self, **kwargs):
         pass
 
+    def __deepcopy__(self, memo: dict) -> 'Ability':
+        # abilities keep only their configuration, so copies of a game can share them
+        return self
+
     def __eq__(self, other: 'Ability') -> bool:
         return self.__class__ == other.__class__ and self._val == other._val
 
@@ -80,7 +98,14 @@ class DealDamage(Ability):
                 board.attack(card, victim.id)
 
 
+@lru_cache(maxsize=None)
+def _slot_names(cls: type) -> tuple:
+    return tuple(name for klass in cls.__mro__ for name in getattr(klass, '__slots__', ()))
+
+
 class Card(UniqueIdentifierMixin):
+    __slots__ = ('name', 'cost', '_was_played', 'ability', 'type')
+
     def __init__(self, name: str, cost: int, ability: Ability):
         super(Card, self).__init__()
         self.name = name
@@ -95,6 +120,30 @@ class Card(UniqueIdentifierMixin):
             self.ability.apply(self, phase_name='play', **kwargs)
             self._was_played = True
 
+    def _shallow_copy(self) -> 'Card':
+        card = object.__new__(self.__class__)
+        for name in _slot_names(self.__class__):
+            setattr(card, name, getattr(self, name))
+        return card
+
+    def __deepcopy__(self, memo: dict) -> 'Card':
+        # all card attributes are scalars, strings or a shared ability
+        card = self._shallow_copy()
+        memo[id(self)] = card
+        return card
+
+    def clone(self) -> 'Card':
+        # new identity with the same stats, without running the ability init phase again
+        card = self._shallow_copy()
+        super(Card, card).__init__()
+        return card
+
+    def snapshot(self) -> tuple:
+        return self._was_played,
+
+    def restore(self, state: tuple):
+        self._was_played, = state
+
     def __str__(self) -> str:
         return '{0.name} ({0.id}) {0.type}'.format(self)
 
@@ -103,11 +152,20 @@ class Card(UniqueIdentifierMixin):
 
 
 class AbilityCard(Card):
+    __slots__ = ('damage', 'can_attack')
+
     def __init__(self, name: str, cost: int, ability: Ability):
         self.damage = 0  # ability can change it during init phase
+        self.can_attack = False
         super(AbilityCard, self).__init__(name, cost, ability)
         self.type = 'spell'
 
+    def snapshot(self) -> tuple:
+        return self._was_played, self.damage, self.can_attack
+
+    def restore(self, state: tuple):
+        self._was_played, self.damage, self.can_attack = state
+
     def attack(self, victim: Union['MinionCard', 'Player']) -> List['MinionCard']:
         try:
             victim.health -= self.damage
@@ -117,6 +175,8 @@ class AbilityCard(Card):
 
 
 class MinionCard(Card):
+    __slots__ = ('damage', '_health', 'can_attack')
+
     def __init__(self, name: str, cost: int, attack: int, health: int, ability: Ability = Ability()):
         self.damage = attack
         self._health = health
@@ -131,6 +191,12 @@ class MinionCard(Card):
         board.play_card(player=player, card=self)
         super(MinionCard, self).play(player=player, board=board, target_id=target_id, **kwargs)
 
+    def snapshot(self) -> tuple:
+        return self._was_played, self.damage, self._health, self.can_attack
+
+    def restore(self, state: tuple):
+        self._was_played, self.damage, self._health, self.can_attack = state
+
     @property
     def health(self):
         return self._health
@@ -169,6 +235,10 @@ class Deck:
         self.cards = self.all_cards
         self.empty_card = 0
 
+    @classmethod
+    def from_template(cls, cards: Iterable[Card]) -> 'Deck':
+        return cls(card.clone() for card in cards)
+
     @property
     def all_cards(self) -> List[Card]:
         return list(self._all_cards.values())
@@ -180,8 +250,9 @@ class Deck:
         random.shuffle(self.cards)
 
     def deal(self, number: int = 1)->Iterable[Card]:
+        # the deck is shuffled once up front, dealing just takes cards off the top in place
         next_cards = self.cards[:number]
-        self.cards = self.cards[number:]
+        del self.cards[:number]
         difference = number - len(next_cards)
         if difference > 0:
             self.empty_card += difference
@@ -191,6 +262,13 @@ class Deck:
     def remove(self, card: Card):
         self.cards.remove(card)
 
+    def snapshot(self) -> tuple:
+        return tuple(self.cards), self.empty_card
+
+    def restore(self, state: tuple):
+        cards, self.empty_card = state
+        self.cards = list(cards)
+
     def __len__(self):
         return len(self.cards)
 
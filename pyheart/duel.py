@@ -177,6 +177,7 @@ class Arena:
             print('Elapsed:', end - start)
 
     def start_duel(self, duel):
+        ActionGenerator.clear_cache()
         latest_info = {}
         all_info = []
         while not latest_info.get('game_over'):
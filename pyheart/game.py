@@ -83,10 +83,33 @@ class Player(UniqueIdentifierMixin):
         del self._hand[card.id]
         self._graveyard.append(card)
 
+    def can_play(self, card: Card) -> bool:
+        return card.id in self._hand and card.cost <= self.mana
+
     def attack(self, attacker_id: str, victim: Union['Player', str]):
         attacker = self._board.get_card(attacker_id, player=self)
         self._board.attack(attacker, victim)
 
+    def snapshot(self) -> tuple:
+        return self._health, self._current_mana, self.used_mana, tuple(self._hand.values()), tuple(self._graveyard)
+
+    def restore(self, state: tuple):
+        self._health, self._current_mana, self.used_mana, hand, graveyard = state
+        self.hand = hand
+        self._graveyard = list(graveyard)
+
+    def state_key(self) -> tuple:
+        return (
+            self.id,
+            self._health,
+            self._current_mana,
+            self.used_mana,
+            frozenset(self._hand),
+            frozenset(card.id for card in self._graveyard),
+            len(self.deck),
+            self.deck.empty_card,
+        )
+
     def take_cards(self, number: int):
         try:
             new_cards = {card.id: card for card in self.deck.deal(number)}
@@ -109,17 +132,16 @@ class Board:
     MAX_CARDS_PER_PLAYER = 7
 
     def __init__(self):
-        self._player_cards = defaultdict(set)
+        self._player_cards = defaultdict(list)
         self._cards = {}
+        self._positions = {}  # card id -> (player id, index in player's cards)
 
     def reset_cards(self, player: Player):
-        player_cards = self._player_cards[player.id]
-        for card_id in player_cards:
-            self._cards[card_id].can_attack = True
+        for card in self._player_cards[player.id]:
+            card.can_attack = True
 
     def play_card(self, player: Player, card: Card):
-        played_cards = self.played_cards(player)
-        if len(played_cards) >= self.MAX_CARDS_PER_PLAYER:
+        if len(self._player_cards[player.id]) >= self.MAX_CARDS_PER_PLAYER:
             raise TooManyCardsError('Player can have only {0} cards on board'.format(self.MAX_CARDS_PER_PLAYER))
         self._add_card(player, card)
 
@@ -136,8 +158,7 @@ class Board:
     def played_cards(self, player: Union[Player, str]=None) -> List[MinionCard]:
         if player:
             player_id = getattr(player, 'id', player)
-            player_cards = self._player_cards[player_id]
-            return list(map(lambda card_id: self._cards[card_id], player_cards))
+            return list(self._player_cards[player_id])
         return list(self._cards.values())
 
     def enemy_cards(self, player: Player) -> List[MinionCard]:
@@ -149,28 +170,62 @@ class Board:
             return list()
         return self.played_cards(enemy_id)
 
+    def contains(self, card: Card, player: Union[Player, str] = None) -> bool:
+        position = self._positions.get(card.id)
+        if position is None:
+            return False
+        return player is None or position[0] == getattr(player, 'id', player)
+
     def get_card(self, card_id: str, player: Player) -> MinionCard:
         try:
-            if card_id not in self._player_cards[player.id]:
+            player_id, index = self._positions[card_id]
+            if player_id != player.id:
                 raise KeyError
 
-            return self._cards[card_id]
+            return self._player_cards[player_id][index]
         except KeyError:
             raise MissingCardError('Card {0} not played'.format(self, card_id))
 
+    def snapshot(self) -> tuple:
+        return tuple((player_id, tuple(cards)) for player_id, cards in self._player_cards.items())
+
+    def restore(self, state: tuple):
+        self._player_cards = defaultdict(list)
+        self._cards = {}
+        self._positions = {}
+        for player_id, cards in state:
+            player_cards = self._player_cards[player_id]
+            for card in cards:
+                self._append_card(player_id, player_cards, card)
+
+    def state_key(self) -> frozenset:
+        return frozenset(
+            (card.id, player_id, card.health, card.damage, card.can_attack)
+            for player_id, cards in self._player_cards.items()
+            for card in cards
+        )
+
     def _add_card(self, player: Player, card: Card):
-        self._player_cards[player.id].add(card.id)
+        self._append_card(player.id, self._player_cards[player.id], card)
+
+    def _append_card(self, player_id: str, player_cards: List[Card], card: Card):
+        self._positions[card.id] = (player_id, len(player_cards))
         self._cards[card.id] = card
+        player_cards.append(card)
 
     def _remove_card(self, card: Card):
         del self._cards[card.id]
+        player_id, index = self._positions.pop(card.id)
 
-        # We can remove card from all players because id is globally unique
-        for player_cards in self._player_cards.values():
-            player_cards.discard(card.id)
+        # swap the last card into the freed slot to keep removal O(1)
+        player_cards = self._player_cards[player_id]
+        last_card = player_cards.pop()
+        if index < len(player_cards):
+            player_cards[index] = last_card
+            self._positions[last_card.id] = (player_id, index)
 
     def __len__(self) -> int:
-        return len(self.played_cards())
+        return len(self._cards)
 
     def __repr__(self) -> str:
         fmt = '<{0.__class__.__name__} all cards: {1}, players cards: {2}>'
@@ -181,22 +236,29 @@ class Game:
     NUMBERS_OF_START_CARDS = (3, 4)
     DEFAULT_PLAYER_NAMES = ('Player 1', 'Player 2')
 
-    def __init__(self, player_names: Iterable[str] = DEFAULT_PLAYER_NAMES, player_decks: Iterable[Deck] = None):
+    def __init__(self, player_names: Iterable[str] = DEFAULT_PLAYER_NAMES, player_decks: Iterable[Deck] = None,
+                 numbers_of_start_cards: Iterable[int] = None):
         self.board = Board()
         if player_decks is None:
             player_decks = [DefaultDeck() for _ in player_names]
+        if numbers_of_start_cards is None:
+            numbers_of_start_cards = self.NUMBERS_OF_START_CARDS
 
         players = [
             Player(name, start_cards, deck, self.board)
-            for name, start_cards, deck in zip(player_names, self.NUMBERS_OF_START_CARDS, player_decks)
+            for name, start_cards, deck in zip(player_names, numbers_of_start_cards, player_decks)
         ]
         self._players = {p.id: p for p in players}
         self._turn = 0
         self._game_started = False
 
+    @property
+    def is_over(self) -> bool:
+        return any(player.health <= 0 for player in self._players.values())
+
     def _calculate_turn(self, turn):
-        players_number = len(self.players)
-        return self.players[turn % players_number]
+        players = self.players
+        return players[turn % len(players)]
 
     @property
     def players(self):
@@ -224,9 +286,19 @@ class Game:
 
     def endturn(self, player_id: str):
         self._check_state(player_id)
+        self._next_turn()
+
+    def advance_turns(self, number: int):
+        # ends `number` turns in a row, whoever's turn it is
+        self._check_state(self.current_player.id)
+        for _ in range(number):
+            self._next_turn()
+
+    def _next_turn(self):
         self._turn += 1
-        self.board.reset_cards(self.current_player)
-        self._reset_player(self.current_player)
+        current_player = self.current_player
+        self.board.reset_cards(current_player)
+        self._reset_player(current_player)
 
     @staticmethod
     def _reset_player(player: Player):
@@ -250,6 +322,27 @@ class Game:
 
         self.current_player.attack(attacker_id, victim_id)
 
+    # can_play/can_attack are cheap pre-checks that never raise: False means the action is certainly invalid,
+    # True means it passed the basic rules and may still be rejected by card abilities
+    def can_play(self, player: Player, card: Card, target: Optional[Card] = None) -> bool:
+        if not self._is_player_turn(player) or not player.can_play(card):
+            return False
+        if isinstance(card, MinionCard):
+            if target is not None and not card.ability.can_target:
+                return False
+            return len(self.board.played_cards(player)) < self.board.MAX_CARDS_PER_PLAYER
+        return True
+
+    def can_attack(self, player: Player, attacker: MinionCard, victim: Union[Player, MinionCard]) -> bool:
+        if not self._is_player_turn(player) or not attacker.can_attack:
+            return False
+        if not self.board.contains(attacker, player):
+            return False
+        return victim.id in self._players or self.board.contains(victim)
+
+    def _is_player_turn(self, player: Player) -> bool:
+        return self._game_started and player.id == self.current_player.id
+
     def play(self, player_id: str, card_id: str, target_id: str = None):
         self._check_state(player_id)
         self.current_player.play(card_id, target_id)
@@ -257,6 +350,28 @@ class Game:
     def copy(self) -> 'Game':
         return deepcopy(self)
 
+    def snapshot(self) -> tuple:
+        decks = {id(player.deck): player.deck for player in self.players}.values()
+        cards = [card for deck in decks for card in deck.all_cards]
+        return (
+            self._turn,
+            self._game_started,
+            self.board.snapshot(),
+            tuple((player, player.snapshot()) for player in self.players),
+            tuple((deck, deck.snapshot()) for deck in decks),
+            tuple((card, card.snapshot()) for card in cards),
+        )
+
+    def restore(self, state: tuple):
+        self._turn, self._game_started, board, players, decks, cards = state
+        self.board.restore(board)
+        for owner, owner_state in players + decks + cards:
+            owner.restore(owner_state)
+
+    def state_key(self) -> tuple:
+        players = tuple(player.state_key() for player in self.players)
+        return self._game_started, self.current_player.id, players, self.board.state_key()
+
     def __str__(self):
         first, second = self.players
         player_line = '{0.name} ({0.id}) [{0.health} HP | {0.mana}/{0.current_mana} MANA]\n'
@@ -2,15 +2,14 @@ from uuid import uuid4
 
 
 class UniqueIdentifierMixin:
-    def __init__(self):
-        self._uuid, *_ = str(uuid4()).split('-')
+    # a plain slot rather than a property, ids are read in every hot loop of the search
+    __slots__ = ('id',)
 
-    @property
-    def id(self) -> str:
-        return str(self._uuid)
+    def __init__(self):
+        self.id, *_ = str(uuid4()).split('-')
 
     def __hash__(self) -> int:
-        return hash(self.__class__) ^ hash(self._uuid)
+        return hash(self.__class__) ^ hash(self.id)
 
     def __eq__(self, other: 'UniqueIdentifierMixin') -> bool:
         return self.__class__ == other.__class__ and self.id == other.id
@@ -1,55 +1,126 @@
 import random
-from math import sqrt, log
-from collections import deque
-from typing import Iterator, Callable, Optional, Iterable
+from array import array
+from math import sqrt, log, inf
+from collections import deque, Counter, OrderedDict
+from concurrent.futures import Executor, Future
+from typing import TYPE_CHECKING, Iterator, Callable, Optional, Iterable, List, Sequence
 
 from pyheart.exceptions import InvalidActionError, DeadPlayerError
 from pyheart.game import Game
 
+if TYPE_CHECKING:
+    from pyheart.game import Player
 
-class ChildrenContainer:
+
+class RandomBuffer:
+    # drop-in for the random module functions used by the search, serving pre-generated 64-bit values
+    SIZE = 1024
+
+    def __init__(self, size: int = SIZE, source=random):
+        self._source = source
+        self._size = size
+        self._values = ()
+        self._index = size
+
+    def _refill(self):
+        data = self._source.getrandbits(64 * self._size).to_bytes(8 * self._size, 'little')
+        self._values = memoryview(data).cast('Q')
+        self._index = 0
+
+    def _next(self) -> int:
+        if self._index >= self._size:
+            self._refill()
+        value = self._values[self._index]
+        self._index += 1
+        return value
+
+    def random(self) -> float:
+        return (self._next() >> 11) * (1.0 / (1 << 53))
+
+    def randrange(self, start: int, stop: int) -> int:
+        return start + self._next() % (stop - start)
+
+    def choice(self, items: Sequence):
+        if not items:
+            raise IndexError('Cannot choose from an empty sequence')
+        return items[self._next() % len(items)]
+
+    def shuffle(self, items: list):
+        for i in range(len(items) - 1, 0, -1):
+            j = self._next() % (i + 1)
+            items[i], items[j] = items[j], items[i]
+
+
+def random_permutation(size: int, rng=random) -> Iterator[int]:
+    # lazy Fisher-Yates: each index costs one randrange call and callers may stop early
+    swapped = {}
+    for i in range(size):
+        j = rng.randrange(i, size)
+        yield swapped.get(j, j)
+        swapped[j] = swapped.get(i, i)
+
+
+def random_pairs(first: Sequence, second: Sequence, rng=random) -> Iterator[tuple]:
+    columns = len(second)
+    for index in random_permutation(len(first) * columns, rng):
+        yield first[index // columns], second[index % columns]
+
+
+class ChildrenContainer(list):
     def __init__(self, iterable: Iterable = ()):
-        self._list = list(iterable)
-        self._set = set(self._list)
+        super(ChildrenContainer, self).__init__(iterable)
+        self._keys = {child._key for child in self}
 
     def add(self, child):
-        if child in self:
+        # dedup on the node key itself, so nodes with colliding hashes stay distinct
+        if child._key in self._keys:
             return False
-        self._list.append(child)
-        self._set.add(child)
+        self._keys.add(child._key)
+        self.append(child)
         return True
 
     def __contains__(self, item):
-        return item in self._set
-
-    def __getitem__(self, item):
-        return self._list[item]
+        return item._key in self._keys
 
     def __getattr__(self, item):
-        return ChildrenContainer(getattr(child, item) for child in self._list)
+        if item.startswith('__'):
+            raise AttributeError(item)
+        return [getattr(child, item) for child in self]
 
-    def __str__(self):
-        return str(self._list)
 
-    def __repr__(self):
-        return repr(self._list)
+class _NoChildren(ChildrenContainer):
+    # shared by every leaf, so it must never be filled in place
+    def _frozen(self, *args, **kwargs):
+        raise TypeError('Leaf nodes share an empty children container, use Node.add_child')
 
-    def __iter__(self):
-        return iter(self._list)
+    add = append = extend = insert = pop = remove = clear = sort = reverse = _frozen
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _frozen
 
-    def __len__(self):
-        return len(self._list)
+
+_NO_CHILDREN = _NoChildren()
 
 
 class Node:
+    __slots__ = (
+        'tree', 'idx', 'children', 'is_terminal', 'is_expandable', 'forced_reward', 'parent', 'depth', '_key',
+        '_hash')
+    chance = 1
+
     def __init__(self):
-        self.visits = 0
-        self.children = ChildrenContainer()
-        self.wins = 0
-        self.losses = 0
+        self.tree = None
+        self.idx = None
+        self.children = _NO_CHILDREN
         self.is_terminal = False
         self.is_expandable = True
+        self.forced_reward = None
         self.parent = None
+        self.depth = 0
+        self._set_key(self.__class__)
+
+    def _set_key(self, *key):
+        # identity used for dedup and lookups: node kind plus the ids of involved objects
+        self._key = key
+        self._hash = hash(key)
 
     def find_node(self, node: Optional['Node']):
         if node is None:
@@ -63,6 +134,24 @@ class Node:
             queue.extendleft(n.children)
         return None
 
+    @property
+    def visits(self) -> int:
+        if self.tree is None:
+            return 0
+        return self.tree._visits[self.idx]
+
+    @property
+    def wins(self) -> float:
+        if self.tree is None:
+            return 0
+        return self.tree._wins[self.idx]
+
+    @property
+    def losses(self) -> float:
+        if self.tree is None:
+            return 0
+        return self.tree._losses[self.idx]
+
     @property
     def exploration_rate(self) -> float:
         if self.is_leaf:
@@ -83,29 +172,39 @@ class Node:
 
     @property
     def score(self) -> float:
-        total_games = self.wins + self.losses
-        if total_games:
-            return self.wins / total_games
-        return 0
+        if self.tree is None:
+            return 0
+        return self.tree._scores[self.idx]
 
     def add_children(self, children: Iterable['Node']):
         for child in children:
             self.add_child(child)
 
     def add_child(self, child: 'Node') -> bool:
+        if self.children is _NO_CHILDREN:
+            # leaves share one empty container, a node gets its own with the first child
+            self.children = ChildrenContainer()
         added = self.children.add(child)
         if added:
             child.parent = self
+            child.update_depth()
+            if self.tree is not None:
+                self.tree._attach(child)
         return added
 
     @property
     def path(self) -> Iterator['Node']:
-        path = [self]
-        parent_node = self.parent
-        while parent_node:
-            path.append(parent_node)
-            parent_node = parent_node.parent
-        return path
+        node = self
+        while node is not None:
+            yield node
+            node = node.parent
+
+    def update_depth(self):
+        queue = [self]
+        while queue:
+            node = queue.pop()
+            node.depth = node.parent.depth + 1 if node.parent is not None else 0
+            queue.extend(node.children)
 
     @property
     def is_leaf(self) -> bool:
@@ -118,68 +217,74 @@ class Node:
         if len(self.children) == 1:
             return self.children[0]
 
-        children = list(self.children)
-        children.sort(key=scoring_function)
-        return children.pop()
+        return max(self.children, key=scoring_function)
 
     def apply(self, game_state: Game):
         pass
 
-    def visit(self):
-        self.visits += 1
+    @property
+    def descriptor(self) -> tuple:
+        return self.__class__, self.forced_reward
 
     def __hash__(self) -> int:
-        return hash(self.__class__)
+        return self._hash
 
     def __eq__(self, other: 'Node') -> bool:
-        return hash(self) == hash(other)
+        return isinstance(other, Node) and self._key == other._key
 
     def backup(self, reward: float):
-        self.visit()
-        if reward > 0:
-            self.wins += reward
-        else:
-            self.losses += abs(reward)
-
-        if self.parent is not None:
-            self.parent.backup(reward)
+        self.tree.backup(self, reward)
 
 
 class InitialGameNode(Node):
+    __slots__ = ()
+
     def __str__(self):
         return 'Initial game state'
 
 
 class AttackNode(Node):
+    __slots__ = ('player', 'attacker', 'victim')
+
     def __init__(self, player, attacker, victim):
         super(AttackNode, self).__init__()
         self.player = player
         self.attacker = attacker
         self.victim = victim
+        self._set_key(AttackNode, player.id, attacker.id, victim.id)
 
     def apply(self, game_state):
         game_state.attack(self.player.id, self.attacker.id, self.victim.id)
 
+    @property
+    def descriptor(self) -> tuple:
+        return self.__class__, self.forced_reward, self.player.id, self.attacker.id, self.victim.id
+
     def __repr__(self) -> str:
         return '<{0.__class__.__name__} attacker: {0.attacker!r} victim: {0.victim!r}>'.format(self)
 
     def __str__(self) -> str:
         return '{0.player} attacked {0.victim} with {0.attacker}'.format(self)
 
-    def __hash__(self) -> int:
-        return hash(self.__class__) ^ hash(self.player) ^ hash(self.attacker) ^ hash(self.victim)
-
 
 class PlayCartNode(Node):
+    __slots__ = ('player', 'card', 'target')
+
     def __init__(self, player, card, target=None):
         super(PlayCartNode, self).__init__()
         self.player = player
         self.card = card
         self.target = target
+        # known and non-deterministic plays of the same card are the same action
+        self._set_key(PlayCartNode, player.id, card.id, getattr(target, 'id', None))
 
     def apply(self, game_state: 'Game'):
         game_state.play(self.player.id, self.card.id, getattr(self.target, 'id', None))
 
+    @property
+    def descriptor(self) -> tuple:
+        return self.__class__, self.forced_reward, self.player.id, self.card.id, getattr(self.target, 'id', None)
+
     def __repr__(self) -> str:
         return '<{0.__class__.__name__} card: {0.card!r} target: {0.target!r}>'.format(self)
 
@@ -189,31 +294,27 @@ class PlayCartNode(Node):
             fmt += ' on {0.target}'
         return fmt.format(self)
 
-    def __hash__(self) -> int:
-        return hash(self.__class__) ^ hash(self.player) ^ hash(self.card) ^ hash(self.target)
-
-    def __eq__(self, other: Node) -> bool:
-        if isinstance(other, PlayCartNode):
-            attrs = ['player', 'card', 'target']
-            return all(getattr(self, attr) == getattr(other, attr) for attr in attrs)
-        return super(PlayCartNode, self).__eq__(other)
-
 
 class NonDeterministicPlayCartNode(PlayCartNode):
+    __slots__ = ('chance',)
+
     def __init__(self, chance, player, card, target=None):
         super(NonDeterministicPlayCartNode, self).__init__(player, card, target)
         self.chance = chance
 
     def apply(self, game_state: 'Game'):
-        if self.card not in self.player.hand:
-            player = game_state.player_by_id(self.player.id)
+        # nodes outlive the replay game they were created on, so the owner is looked up in game_state
+        player = game_state.player_by_id(self.player.id)
+        if self.card not in player.hand:
             card = player.deck.card_by_id(self.card.id)
             player.hand += [card]
             player.deck.remove(card)
         super(NonDeterministicPlayCartNode, self).apply(game_state)
 
-    def backup(self, reward: float):
-        super(NonDeterministicPlayCartNode, self).backup(reward * self.chance)
+    @property
+    def descriptor(self) -> tuple:
+        node_class, forced_reward, *arguments = super(NonDeterministicPlayCartNode, self).descriptor
+        return (node_class, forced_reward, self.chance, *arguments)
 
     def __str__(self):
         parent = super(NonDeterministicPlayCartNode, self)
@@ -222,89 +323,137 @@ class NonDeterministicPlayCartNode(PlayCartNode):
 
 
 class EndTurnNode(Node):
+    __slots__ = ('player',)
+
     def __init__(self, player: 'Player'):
         super(EndTurnNode, self).__init__()
         self.player = player
+        self._set_key(EndTurnNode, player.id)
 
     def apply(self, game_state: 'Game'):
         game_state.endturn(self.player.id)
 
+    @property
+    def descriptor(self) -> tuple:
+        return self.__class__, self.forced_reward, self.player.id
+
     def __str__(self) -> str:
         return '{0.player} ended turn'.format(self)
 
     def __repr__(self) -> str:
         return '<{0.__class__.__name__} player: {0.player!r}>'.format(self)
 
-    def __hash__(self) -> int:
-        return super(EndTurnNode, self).__hash__() ^ hash(self.player)
+
+def _reward(player: 'Player', error: DeadPlayerError) -> int:
+    return -1 if error.player == player else 1
 
 
 class ActionGenerator:
-    def __init__(self, game_state: Game, apply: bool = False, player: Optional['Player'] = None):
+    CACHE_SIZE = 4096
+    _cache = OrderedDict()
+
+    def __init__(self, game_state: Game, apply: bool = False, player: Optional['Player'] = None, rng=random):
         self.game_state = game_state
         self.apply = apply
         self.player = player or game_state.current_player
+        self.rng = rng
+        self._objects = None
+
+    @classmethod
+    def clear_cache(cls):
+        cls._cache.clear()
 
     def _is_valid_action(self, action: Optional[Node]) -> bool:
         if action is None:
             return False
 
+        snapshot = self.game_state.snapshot()
         try:
-            action.apply(self.game_state.copy())
+            action.apply(self.game_state)
         except InvalidActionError:
             return False
+        finally:
+            self.game_state.restore(snapshot)
         return True
 
     def _handle_invalid_actions(self, generator: Iterator[Node]) -> Iterator[Node]:
-        all_actions = generator
-        while True:
-            action = next(all_actions)
+        for action in generator:
             is_valid = True
             try:
                 is_valid = self._is_valid_action(action)
-            except DeadPlayerError:
+            except DeadPlayerError as e:
                 action.is_terminal = True
+                action.forced_reward = _reward(self.player, e)
 
             if is_valid:
                 yield action
 
-    def attack_actions(self) -> Iterator[AttackNode]:
-        actions_generator = self._all_attack_actions()
-        yield from self._handle_invalid_actions(actions_generator)
+    def _valid_actions(self, all_actions: Callable[[], Iterator[Node]], name: Optional[str] = None) -> Iterable[Node]:
+        # rollouts stop at the first valid action, so they validate lazily; expansion needs every action
+        # and gets a plain list straight from the descriptor cache
+        if self.apply:
+            return self._handle_invalid_actions(all_actions())
+
+        # forced rewards are relative to the generator's player, so it is part of the key
+        key = (name or all_actions.__name__, self.player.id, self.game_state.state_key())
+        descriptors = self._cache.get(key)
+        if descriptors is None:
+            descriptors = tuple(action.descriptor for action in self._handle_invalid_actions(all_actions()))
+            self._cache[key] = descriptors
+            if len(self._cache) > self.CACHE_SIZE:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(key)
+
+        resolve = self._resolve
+        actions = [resolve(descriptor) for descriptor in descriptors]
+        self.rng.shuffle(actions)
+        return actions
+
+    def _resolve(self, descriptor: tuple) -> Node:
+        if self._objects is None:
+            players = self.game_state.players
+            self._objects = {player.id: player for player in players}
+            self._objects.update((card.id, card) for player in players for card in player.deck.all_cards)
+
+        node_class, forced_reward, *arguments = descriptor
+        action = node_class(*(self._objects.get(argument, argument) for argument in arguments))
+        action.is_terminal = forced_reward is not None
+        action.forced_reward = forced_reward
+        return action
+
+    def attack_actions(self) -> Iterable[AttackNode]:
+        return self._valid_actions(self._all_attack_actions)
 
     def _all_attack_actions(self) -> Iterator[AttackNode]:
         board = self.game_state.board
         player = self.game_state.current_player
         player_cards = board.played_cards(player)
-        random.shuffle(player_cards)
 
         enemy = self.game_state.next_player
         enemy_targets = board.played_cards(enemy)
         enemy_targets.append(enemy)
-        random.shuffle(enemy_targets)
 
-        for attacker in player_cards:
-            for victim in enemy_targets:
+        for attacker, victim in random_pairs(player_cards, enemy_targets, self.rng):
+            if self.game_state.can_attack(player, attacker, victim):
                 yield AttackNode(player, attacker, victim)
 
-    def play_actions(self) -> Iterator[PlayCartNode]:
-        actions_generator = self._all_unknown_play_actions()
+    def play_actions(self) -> Iterable[PlayCartNode]:
+        return self._valid_actions(self._play_candidates())
 
+    def _play_candidates(self) -> Callable[[], Iterator[PlayCartNode]]:
         if self.game_state.current_player == self.player:
-            actions_generator = self._all_known_play_actions()
-
-        yield from self._handle_invalid_actions(actions_generator)
+            return self._all_known_play_actions
+        return self._all_unknown_play_actions
 
     def _all_known_play_actions(self) -> Iterator[PlayCartNode]:
         player = self.game_state.current_player
-        hand = player.hand
-        random.shuffle(hand)
-
         player_cards = self.game_state.board.played_cards(player)
         player_cards.append(None)
-        for card in hand:
-            random.shuffle(player_cards)
-            for target in player_cards:
+        mana = player.mana
+        affordable_cards = [card for card in player.hand if card.cost <= mana]
+        for card, target in random_pairs(affordable_cards, player_cards, self.rng):
+            if self.game_state.can_play(player, card, target):
                 yield PlayCartNode(player, card, target)
 
     def _all_unknown_play_actions(self) -> Iterator[PlayCartNode]:
@@ -314,61 +463,194 @@ class ActionGenerator:
         graveyard = set(player.graveyard)
 
         available_cards = list(deck - (already_played | graveyard))
-        random.shuffle(available_cards)
+        if not available_cards:
+            return
         potential_targets = list(already_played)
         potential_targets.append(None)
 
         chance = len(player.hand) / len(available_cards)
-        for card in available_cards:
-            random.shuffle(potential_targets)
-            for target in potential_targets:
-                yield NonDeterministicPlayCartNode(chance, player, card, target)
+        mana = player.mana
+        affordable_cards = [card for card in available_cards if card.cost <= mana]
+        for card, target in random_pairs(affordable_cards, potential_targets, self.rng):
+            yield NonDeterministicPlayCartNode(chance, player, card, target)
+
+    def endturn_action(self) -> Iterable[EndTurnNode]:
+        return self._valid_actions(self._all_endturn_actions)
+
+    def _all_endturn_actions(self) -> Iterator[EndTurnNode]:
+        yield EndTurnNode(self.game_state.current_player)
+
+    def all_actions(self) -> Iterable[Node]:
+        # every action kind from one enumeration and one cache entry, used when expanding a node
+        play_candidates = self._play_candidates()
 
-    def endturn_action(self) -> Iterator[EndTurnNode]:
-        action = EndTurnNode(self.game_state.current_player)
-        actions_generator = iter([action])
-        yield from self._handle_invalid_actions(actions_generator)
+        def _all_actions() -> Iterator[Node]:
+            yield from play_candidates()
+            yield from self._all_attack_actions()
+            yield from self._all_endturn_actions()
+        return self._valid_actions(_all_actions, name=play_candidates.__name__ + '+all')
 
     def random_actions(self) -> Iterator[Node]:
-        available_generators = [self.play_actions(), self.attack_actions(), self.endturn_action()]
+        available_generators = [iter(self.play_actions()), iter(self.attack_actions()), iter(self.endturn_action())]
+        randrange = self.rng.randrange
         while available_generators:
-            index = random.randint(0, len(available_generators) - 1)
-            current_generator = available_generators[index]
+            index = randrange(0, len(available_generators))
             try:
-                yield next(current_generator)
+                yield next(available_generators[index])
             except StopIteration:
-                available_generators.remove(current_generator)
+                available_generators[index] = available_generators[-1]
+                available_generators.pop()
+
+    def _applied_actions(self) -> Iterator[Node]:
+        # sub-generators are lazy and validate against the current state, so they survive an applied action
+        # unless it can unlock new candidates: a play can add attackers, an attack can free a slot on a full
+        # board, an ended turn changes everything
+        all_factories = (self.play_actions, self.attack_actions, self.endturn_action)
+        refreshed_factories = {
+            AttackNode: (self.play_actions,),
+            PlayCartNode: (self.play_actions, self.attack_actions),
+            NonDeterministicPlayCartNode: (self.play_actions, self.attack_actions),
+            EndTurnNode: all_factories,
+        }
+        available_generators = [(factory, factory()) for factory in all_factories]
+        randrange = self.rng.randrange
+        while available_generators and not self.game_state.is_over:
+            index = randrange(0, len(available_generators))
+            random_action = next(available_generators[index][1], None)
+            if random_action is None:
+                available_generators[index] = available_generators[-1]
+                available_generators.pop()
+                continue
+
+            yield random_action
+            if random_action.is_terminal:
+                return
+            random_action.apply(self.game_state)
+
+            refreshed = refreshed_factories.get(random_action.__class__, ())
+            if refreshed:
+                available_generators = [item for item in available_generators if item[0] not in refreshed]
+                available_generators.extend((factory, factory()) for factory in refreshed)
 
     def __iter__(self):
+        if self.apply:
+            yield from self._applied_actions()
+            return
+
         action_generator = self.random_actions()
-        random_action = next(action_generator)
-        while not random_action.is_terminal:
+        random_action = next(action_generator, None)
+        while random_action is not None and not random_action.is_terminal:
             yield random_action
-            if self.apply:
-                random_action.apply(self.game_state)
-                random_action = next(self.random_actions())
-            else:
-                random_action = next(action_generator)
-        yield random_action
+            random_action = next(action_generator, None)
+        if random_action is not None:
+            yield random_action
+
+
+def rollout(game: Game, player: 'Player', rng=random) -> int:
+    action = None
+    for action in ActionGenerator(game, apply=True, player=player, rng=rng):
+        pass
+    if action is None or action.forced_reward is None:
+        raise RuntimeError('rollout ended without a terminal action')
+    return action.forced_reward
+
+
+def _root_visits(game: Game, iterations: int, seed: int) -> dict:
+    # worker side of root parallelisation, only the root tally travels back to the caller
+    tree = GameTree(game, rng=random.Random(seed))
+    tree.run(iterations)
+    return tree._root_votes()
 
 
 class GameTree:
-    def __init__(self, game_state: Game = None):
+    EXPLORATION_CONSTANT = 1 / sqrt(2)
+    VIRTUAL_LOSS = 1
+    ROLLOUTS_PER_LEAF = 1
+
+    def __init__(self, game_state: Game = None, rng=random):
         if game_state is None:
             self.game = Game()
             self.game.start()
         else:
             self.game = game_state.copy()
         self.player = self.game.current_player
+        self._reset_replay()
+        self._reset_statistics()
+        self._rng = RandomBuffer(source=rng)
         self.root = InitialGameNode()
+        self._attach(self.root)
+        self._transpositions = {self.game.state_key(): self.root.idx}
+
+    def _reset_statistics(self):
+        self._size = 0
+        self._height = 0
+        self._visits = array('l')
+        self._wins = array('d')
+        self._losses = array('d')
+        self._scores = array('d')
+
+    def _allocate(self, visits: int = 0, wins: float = 0, losses: float = 0, score: float = 0) -> int:
+        self._visits.append(visits)
+        self._wins.append(wins)
+        self._losses.append(losses)
+        self._scores.append(score)
+        return len(self._visits) - 1
+
+    def _update_score(self, idx: int):
+        total_games = self._wins[idx] + self._losses[idx]
+        self._scores[idx] = self._wins[idx] / total_games if total_games else 0
+
+    def _attach(self, node: Node):
+        queue = [node]
+        while queue:
+            n = queue.pop()
+            if n.tree is not self:
+                n.idx = self._allocate(n.visits, n.wins, n.losses, n.score)
+                n.tree = self
+            self._count(n)
+            queue.extend(n.children)
+
+    def _count(self, node: Node):
+        self._size += 1
+        if node.depth > self._height:
+            self._height = node.depth
+
+    def _compact(self):
+        old_statistics = self._visits, self._wins, self._losses, self._scores
+        self._reset_statistics()
+        remapped = {}
+        queue = [self.root]
+        while queue:
+            n = queue.pop()
+            if n.tree is self:
+                if n.idx not in remapped:
+                    remapped[n.idx] = self._allocate(*(values[n.idx] for values in old_statistics))
+                n.idx = remapped[n.idx]
+                self._count(n)
+                queue.extend(n.children)
+            else:
+                self._attach(n)
+        self._transpositions = {
+            key: remapped[idx] for key, idx in self._transpositions.items() if idx in remapped
+        }
+
+    def _transpose(self, game: Game, node: Node):
+        # nodes reaching the same game state share one statistics slot
+        if node.is_terminal or node.chance != 1:
+            return
+        node.apply(game)
+        key = game.state_key()
+        if key not in self._transpositions:
+            self._transpositions[key] = self._allocate()
+        node.tree, node.idx = self, self._transpositions[key]
 
     @property
     def height(self) -> int:
-        return self.root.height
+        return self._height
 
     @property
     def nodes(self) -> int:
-        return self.root.nodes
+        return self._size
 
     @property
     def exploration_rate(self) -> float:
@@ -380,80 +662,210 @@ class GameTree:
             queue.extend(node.children)
         return sum(rates) / len(rates)
 
+    def _reset_replay(self):
+        self._replay_game = self.game.copy()
+        self._replay_snapshot = self._replay_game.snapshot()
+
     def reply_game(self, node: Node) -> Game:
-        game = self.game.copy()
-        for action in reversed(node.path[:-1]):
+        game = self._replay_game
+        game.restore(self._replay_snapshot)
+        actions = [None] * node.depth
+        for index, action in zip(range(node.depth - 1, -1, -1), node.path):
+            actions[index] = action
+        for action in actions:
             action.apply(game)
         return game
 
     def tree_policy(self) -> Node:
         node = self.root
+        calculate_uct = self._calculate_uct
         while not node.is_terminal:
             if node.is_expandable:
                 return self.expand(node)
-            else:
-                node = node.best_child(self._calculate_uct(node))
+            children = node.children
+            if not children:
+                return node
+            node = children[0] if len(children) == 1 else max(children, key=calculate_uct(node))
         return node
 
     def _calculate_uct(self, parent: Node) -> Callable[[Node], float]:
-        def scoring_function(child: Node) -> float:
-            if child.player != self.player:
-                return -random.random()
+        player, scores, visits, rand = self.player, self._scores, self._visits, self._rng.random
+        exploration = 2 * self.EXPLORATION_CONSTANT * sqrt(2 * log(max(parent.visits, 1)))
 
-            const = 1 / sqrt(2)
-            return child.score + 2 * const * sqrt(2 * log(parent.visits) / child.visits)
+        def scoring_function(child: Node) -> float:
+            forced_reward = child.forced_reward
+            if forced_reward is not None:
+                return forced_reward * inf if child.player == player else -forced_reward * inf
+            if child.player != player:
+                return -rand()
+            return scores[child.idx] + exploration / sqrt(visits[child.idx])
         return scoring_function
 
     def expand(self, node: Node) -> Node:
         game = self.reply_game(node)
-        valid_actions = [action for action in ActionGenerator(game, player=self.player) if action not in node.children]
+        valid_actions = []
+        for action in ActionGenerator(game, player=self.player, rng=self._rng).all_actions():
+            if action not in node.children:
+                valid_actions.append(action)
+                if self._is_winning(action):
+                    # expanded on its own, it proves the parent straight away
+                    valid_actions = [action]
+                    break
+            if action.is_terminal:
+                break
 
         if len(valid_actions) <= 1:
             node.is_expandable = False
 
         try:
-            new_node = random.choice(valid_actions)
+            new_node = self._rng.choice(valid_actions)
+            self._transpose(game, new_node)
             node.add_child(new_node)
         except IndexError:
             new_node = node
 
         return new_node
 
+    def _is_winning(self, action: Node) -> bool:
+        reward = action.forced_reward
+        if reward is None or action.chance != 1:
+            return False
+        return reward > 0 if action.player == self.player else reward < 0
+
     def default_policy(self, node: Node) -> float:
+        if node.forced_reward is not None:
+            return node.forced_reward
         try:
             game = self.reply_game(node)
-            action = None
-            for action in ActionGenerator(game, apply=True, player=self.player):
-                pass
-            action.apply(game)
         except DeadPlayerError as e:
-            if e.player == self.player:
-                return -1
-            return 1
+            return _reward(self.player, e)
+        return self.rollout_batch(game, self.ROLLOUTS_PER_LEAF)
+
+    def rollout_batch(self, game: Game, size: int) -> float:
+        # several playouts of one replayed leaf, undone in place between runs and averaged into one reward
+        if size == 1:
+            return rollout(game, self.player, self._rng)
+        snapshot = game.snapshot()
+        total = 0
+        for _ in range(size):
+            total += rollout(game, self.player, self._rng)
+            game.restore(snapshot)
+        return total / size
+
+    def _parallel_policy(self, nodes: List[Node], executor: Executor) -> List[float]:
+        # rewards known without a rollout are resolved here, the rest is played out on the executor
+        rewards = []
+        for node in nodes:
+            reward = node.forced_reward
+            if reward is None:
+                try:
+                    reward = executor.submit(rollout, self.reply_game(node).copy(), self.player)
+                except DeadPlayerError as e:
+                    reward = _reward(self.player, e)
+            rewards.append(reward)
+        return [reward.result() if isinstance(reward, Future) else reward for reward in rewards]
 
     def backup(self, node: Node, reward: float):
-        node.backup(reward)
-
-    def run(self, iterations: int = 1) -> Node:
-        for _ in range(iterations):
-            selected_node = self.tree_policy()
-            reward = self.default_policy(selected_node)
-            self.backup(selected_node, reward)
+        # statistics updated inline over the parent chain, runs once per iteration
+        visits, wins, losses, scores = self._visits, self._wins, self._losses, self._scores
+        proving = node.is_terminal
+        if proving and node.forced_reward is None:
+            node.forced_reward = 1 if reward > 0 else -1
+        while node is not None:
+            reward *= node.chance
+            idx = node.idx
+            visits[idx] += 1
+            if reward > 0:
+                wins[idx] += reward
+            else:
+                losses[idx] -= reward
+            total_games = wins[idx] + losses[idx]
+            scores[idx] = wins[idx] / total_games if total_games else 0
+            node = node.parent
+            if proving and node is not None:
+                proving = self._prove(node)
+
+    def _prove(self, node: Node) -> bool:
+        # the player to move takes a certain win, otherwise a node is decided once every move has the same result
+        children = node.children
+        if node.forced_reward is None and children:
+            mover_reward = 1 if children[0].player == self.player else -1
+            if any(child.forced_reward == mover_reward and child.chance == 1 for child in children):
+                node.forced_reward = mover_reward
+            elif not node.is_expandable and all(child.forced_reward == -mover_reward for child in children):
+                node.forced_reward = -mover_reward
+            else:
+                return False
+            node.is_terminal = True
+        return node.forced_reward is not None
+
+    def _add_virtual_loss(self, node: Node, amount: int):
+        for n in node.path:
+            self._visits[n.idx] += amount
+            self._losses[n.idx] += amount * self.VIRTUAL_LOSS
+            self._update_score(n.idx)
+
+    def expand_batch(self, size: int) -> List[Node]:
+        leaves = []
+        selected = set()
+        while len(leaves) < size:
+            leaf = self.tree_policy()
+            if id(leaf) in selected:
+                break
+            leaves.append(leaf)
+            selected.add(id(leaf))
+            self._add_virtual_loss(leaf, 1)
+
+        for leaf in leaves:
+            self._add_virtual_loss(leaf, -1)
+        return leaves
+
+    def run(self, iterations: int = 1, batch_size: int = 1, executor: Optional[Executor] = None) -> Node:
+        remaining = iterations
+        while remaining > 0:
+            selected_nodes = self.expand_batch(min(batch_size, remaining))
+            if executor is None:
+                rewards = map(self.default_policy, selected_nodes)
+            else:
+                rewards = self._parallel_policy(selected_nodes, executor)
+            for selected_node, reward in zip(selected_nodes, rewards):
+                self.backup(selected_node, reward)
+                remaining -= 1
         return self.best_action
 
+    def _root_votes(self) -> dict:
+        votes = {}
+        for child in self.root.children:
+            # the forced reward differs between workers that did and did not prove a child, so it is left out
+            node_class, _, *arguments = child.descriptor
+            votes[(node_class, *arguments)] = child.visits
+        return votes
+
+    def search_parallel(self, executor: Executor, workers: int, iterations: int) -> Optional[Node]:
+        seeds = [self._rng.randrange(0, 1 << 32) for _ in range(workers)]
+        futures = [executor.submit(_root_visits, self.game, iterations, seed) for seed in seeds]
+        votes = Counter()
+        for future in futures:
+            votes.update(future.result())
+        if not votes:
+            return None
+        node_class, *arguments = max(votes, key=votes.get)
+        return ActionGenerator(self.game)._resolve((node_class, None, *arguments))
+
     @property
     def best_action(self) -> Optional[Node]:
-        children = list(self.root.children)
-        try:
-            return sorted(children, key=lambda k: k.wins).pop()
-        except IndexError:
-            return None
+        wins = self._wins
+        return max(self.root.children, key=lambda k: wins[k.idx], default=None)
 
     def play(self, node: Node):
         found_node = self.root.find_node(node)
         self.root = found_node or InitialGameNode()
         self.root.parent = None
+        self.root.update_depth()
+        self._compact()
         node.apply(self.game)
+        self._reset_replay()
+        self._transpositions.setdefault(self.game.state_key(), self.root.idx)
 
     def __repr__(self) -> str:
         return '<{0.__class__.__name__} nodes: {0.nodes}, height: {0.height}>'.format(self)
@@ -2,8 +2,17 @@ import pytest
 from pyheart import Game
 
 
-@pytest.fixture()
+@pytest.fixture(scope='session')
 def game():
-    start_cards = Game.NUMBERS_OF_START_CARDS
-    yield Game
-    Game.NUMBERS_OF_START_CARDS = start_cards
+    return Game
+
+
+@pytest.fixture(scope='session')
+def prototype_game():
+    return Game()
+
+
+@pytest.fixture()
+def default_game(prototype_game):
+    # copying skips dealing and shuffling two default decks for every test
+    return prototype_game.copy()
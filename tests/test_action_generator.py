@@ -1,5 +1,9 @@
 from pyheart.cards import Deck, MinionCard, ChargeAbility, AbilityCard, DealDamage
-from pyheart.tree import ActionGenerator
+from pyheart.tree import ActionGenerator, RandomBuffer, random_pairs
+
+
+def _count(iterable):
+    return sum(1 for _ in iterable)
 
 
 def test_play_action_generator(game):
@@ -8,17 +12,16 @@ def test_play_action_generator(game):
         MinionCard('test minion 2', health=1, attack=1, cost=1),
         MinionCard('test costly minion', health=1, attack=1, cost=100),
     ])
-    game.NUMBERS_OF_START_CARDS = (2,)
-    g = game(player_decks=[deck])
+    g = game(player_decks=[deck], numbers_of_start_cards=(2,))
     player, = g.players
     g.start()
     gen = ActionGenerator(g)
 
     assert len(player.hand) == 3
-    assert len(list(gen.attack_actions())) == 0
-    assert len(list(gen.play_actions())) == 2
-    assert len(list(gen.endturn_action())) == 1
-    assert len(list(gen.random_actions())) == 3
+    assert _count(gen.attack_actions()) == 0
+    assert _count(gen.play_actions()) == 2
+    assert _count(gen.endturn_action()) == 1
+    assert _count(gen.random_actions()) == 3
 
 
 def test_attack_action_generator_no_board_enemies(game):
@@ -28,8 +31,7 @@ def test_attack_action_generator_no_board_enemies(game):
         MinionCard('test charge minion', health=1, attack=1, cost=0, ability=ChargeAbility()),
     ]
     deck = Deck(cards)
-    game.NUMBERS_OF_START_CARDS = (2, 0)
-    g = game(player_decks=[deck, deck])
+    g = game(player_decks=[deck, deck], numbers_of_start_cards=(2, 0))
     player, _ = g.players
     g.start()
     for card in cards:
@@ -37,10 +39,10 @@ def test_attack_action_generator_no_board_enemies(game):
     gen = ActionGenerator(g)
 
     assert len(player.hand) == 0
-    assert len(list(gen.attack_actions())) == 1  # only charge minion can attack
-    assert len(list(gen.play_actions())) == 0
-    assert len(list(gen.endturn_action())) == 1
-    assert len(list(gen.random_actions())) == 2
+    assert _count(gen.attack_actions()) == 1  # only charge minion can attack
+    assert _count(gen.play_actions()) == 0
+    assert _count(gen.endturn_action()) == 1
+    assert _count(gen.random_actions()) == 2
     assert player.health == 20
 
 
@@ -51,8 +53,7 @@ def test_attack_action_generator_with_enemies(game):
         MinionCard('test charge minion', health=1, attack=1, cost=0, ability=ChargeAbility()),
     ]
     deck = Deck(cards)
-    game.NUMBERS_OF_START_CARDS = (0, 0)
-    g = game(player_decks=[deck, deck])
+    g = game(player_decks=[deck, deck], numbers_of_start_cards=(0, 0))
     first_player, second_player = g.players
     g.start()
     g.play(first_player.id, first_player.hand[0].id)
@@ -67,10 +68,10 @@ def test_attack_action_generator_with_enemies(game):
     assert len(g.board.played_cards(first_player)) == 2
     assert len(g.board.played_cards(second_player)) == 1
     # two minions (played in previous turn and having charge ability) can attack minion and second player
-    assert len(list(gen.attack_actions())) == 4
-    assert len(list(gen.play_actions())) == 0
-    assert len(list(gen.endturn_action())) == 1
-    assert len(list(gen.random_actions())) == 5
+    assert _count(gen.attack_actions()) == 4
+    assert _count(gen.play_actions()) == 0
+    assert _count(gen.endturn_action()) == 1
+    assert _count(gen.random_actions()) == 5
     assert first_player.health == second_player.health == 20
     assert len(g.board) == 3
 
@@ -82,8 +83,7 @@ def test_random_action_generator(game):
         MinionCard('test charge minion', health=1, attack=1, cost=0, ability=ChargeAbility()),
     ]
     deck = Deck(cards)
-    game.NUMBERS_OF_START_CARDS = (0, 0)
-    g = game(player_decks=[deck, deck])
+    g = game(player_decks=[deck, deck], numbers_of_start_cards=(0, 0))
     first_player, second_player = g.players
     g.start()
     g.play(first_player.id, first_player.hand[0].id)
@@ -93,14 +93,15 @@ def test_random_action_generator(game):
 
     gen = ActionGenerator(g)
 
-    assert len(list(gen.attack_actions())) == 2
-    assert len(list(gen.play_actions())) == 1
-    assert len(list(gen.endturn_action())) == 1
-    assert len(list(gen.random_actions())) == 4
+    assert _count(gen.attack_actions()) == 2
+    assert _count(gen.play_actions()) == 1
+    assert _count(gen.endturn_action()) == 1
+    assert _count(gen.random_actions()) == 4
+    assert _count(gen.all_actions()) == 4
 
 
-def test_all_generate_actions_are_applicable(game):
-    g = game()
+def test_all_generate_actions_are_applicable(default_game):
+    g = default_game
     gen = ActionGenerator(g)
 
     assert list(gen.random_actions()) == []
@@ -108,18 +109,21 @@ def test_all_generate_actions_are_applicable(game):
     available_actions = list(gen.random_actions())
     assert len(available_actions) > 0
 
+    snapshot = g.snapshot()
     for action in available_actions:
-        action.apply(g.copy())
+        g.restore(snapshot)
+        action.apply(g)
 
 
-def test_playout(game):
-    g = game()
+def test_playout(default_game):
+    g = default_game
     g.start()
     action = None
     for action in ActionGenerator(g, apply=True):
         print(g.turn, action)
 
     assert action.is_terminal
+    assert action.forced_reward in (-1, 1)
 
 
 def test_play_action_with_ability_cards(game):
@@ -129,11 +133,45 @@ def test_play_action_with_ability_cards(game):
         AbilityCard(name='Flamestrike', cost=0, ability=DealDamage(4)),
     ]
     deck = Deck(cards)
-    game.NUMBERS_OF_START_CARDS = (2, 0)
-    g = game(player_decks=[deck, deck])
+    g = game(player_decks=[deck, deck], numbers_of_start_cards=(2, 0))
     player, _ = g.players
     g.start()
     g.play(player.id, player.hand[0].id)
 
     gen = ActionGenerator(g)
-    assert len(list(gen.play_actions())) == 2
+    assert _count(gen.play_actions()) == 2
+
+
+def test_cached_actions_for_same_game_state(default_game):
+    g = default_game
+    g.start()
+    actions = {action.descriptor for action in ActionGenerator(g).random_actions()}
+    copied_game = g.copy()
+
+    assert {action.descriptor for action in ActionGenerator(copied_game).random_actions()} == actions
+    assert all(
+        action.player is copied_game.current_player
+        for action in ActionGenerator(copied_game).random_actions()
+    )
+
+    ActionGenerator.clear_cache()
+    assert {action.descriptor for action in ActionGenerator(g).random_actions()} == actions
+
+
+def test_random_pairs_yields_whole_product_once():
+    pairs = list(random_pairs('abc', [1, 2]))
+
+    assert len(pairs) == 6
+    assert set(pairs) == {(letter, number) for letter in 'abc' for number in [1, 2]}
+    assert list(random_pairs('abc', [])) == []
+
+
+def test_random_buffer_refills():
+    rng = RandomBuffer(size=4)
+    values = [rng.randrange(3, 7) for _ in range(10)]
+    assert all(3 <= value < 7 for value in values)
+
+    items = list(range(20))
+    rng.shuffle(items)
+    assert sorted(items) == list(range(20))
+    assert 0 <= rng.random() < 1
@@ -1,3 +1,5 @@
+from contextlib import nullcontext
+
 import pytest
 from pyheart.cards import (
     Deck,
@@ -18,9 +20,14 @@ from pyheart.exceptions import (
     TargetNotDefinedError,
     InvalidTargetError)
 
+WEAK_MINION = MinionCard(name='test', cost=1, attack=1, health=2)
+STRONG_MINION = MinionCard(name='test', cost=1, attack=10, health=2)
+CHARGE_MINION = MinionCard(name='test', cost=1, attack=10, health=2, ability=ChargeAbility())
+KILLER_MINION = MinionCard(name='test', cost=1, attack=50, health=2)
+
 
-def test_create_new_game(game):
-    g = game()
+def test_create_new_game(default_game):
+    g = default_game
     assert len(g.players) == 2
     assert len(g.board) == 0
 
@@ -32,7 +39,7 @@ def test_create_new_game(game):
 
 
 def test_play_card_to_board(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=1, health=1) for _ in range(10))
+    deck = Deck.from_template([MinionCard(name='test', cost=1, attack=1, health=1)] * 10)
     g = game(player_decks=[deck])
     player, = g.players
     card = player.hand[0]
@@ -41,13 +48,13 @@ def test_play_card_to_board(game):
     assert player.mana == 1
     g.play(player.id, card.id)
     assert len(g.board) == 1
-    assert card in g.board.played_cards(player)
+    assert g.board.contains(card, player)
     assert card not in player.hand
     assert player.mana == 0
 
 
 def test_not_enough_mana_to_play_card(game):
-    deck = Deck(MinionCard('test', cost=1000, attack=1, health=1) for _ in range(10))
+    deck = Deck.from_template([MinionCard('test', cost=1000, attack=1, health=1)] * 10)
     g = game(player_decks=[deck])
     player, = g.players
     card = player.hand[0]
@@ -57,13 +64,13 @@ def test_not_enough_mana_to_play_card(game):
         g.play(player.id, card.id)
 
     assert len(g.board) == 0
-    assert card not in g.board.played_cards(player)
+    assert not g.board.contains(card, player)
     assert card in player.hand
 
 
-def test_card_played_but_not_in_hand(game):
+def test_card_played_but_not_in_hand(default_game):
     card = MinionCard('test', cost=1, attack=1, health=1)
-    g = game()
+    g = default_game
     player, _ = g.players
     player.hand = []
     g.start()
@@ -72,11 +79,11 @@ def test_card_played_but_not_in_hand(game):
         g.play(player.id, card.id)
 
     assert len(g.board) == 0
-    assert card not in g.board.played_cards(player)
+    assert not g.board.contains(card, player)
 
 
-def test_switch_players_after_turn_end(game):
-    g = game()
+def test_switch_players_after_turn_end(default_game):
+    g = default_game
     first_player, second_player = g.players
 
     assert g.current_player == first_player
@@ -89,8 +96,8 @@ def test_switch_players_after_turn_end(game):
     assert g.current_player == first_player
 
 
-def test_player_deal_new_card_in_turn_start(game):
-    g = game()
+def test_player_deal_new_card_in_turn_start(default_game):
+    g = default_game
     first_player, second_player = g.players
 
     assert len(first_player.hand) == 3
@@ -109,8 +116,8 @@ def test_player_deal_new_card_in_turn_start(game):
     assert len(second_player.hand) == 6
 
 
-def test_fill_players_mana(game):
-    g = game()
+def test_fill_players_mana(default_game):
+    g = default_game
     first_player, second_player = g.players
 
     assert first_player.mana == 0
@@ -126,39 +133,48 @@ def test_fill_players_mana(game):
     assert second_player.mana == 1
 
 
-def test_max_mana_not_above_10(game):
-    g = game()
+@pytest.mark.parametrize('turns, expected', [(17, 9), (18, 10), (20, 10)])
+def test_max_mana_not_above_10(default_game, turns, expected):
+    g = default_game
     player, _ = g.players
     g.start()
-    turns = range(30)
-    for _ in turns:
-        g.endturn(g.current_player.id)
+    # after 20 turn ends the first player starts an 11th turn, the first one above the cap
+    g.advance_turns(turns)
+
+    assert player.mana == expected
 
-    assert player.mana == 10
+
+def test_mana_refill_is_capped(default_game):
+    player, _ = default_game.players
+    player.current_mana = 20
+
+    assert player.current_mana == player.MAX_MANA_LEVEL
+    assert player.mana == player.MAX_MANA_LEVEL
 
 
 def test_player_no_available_cards(game):
     empty_deck = Deck([])
-    game.NUMBERS_OF_START_CARDS = (0, 0)
-    g = game(player_decks=[empty_deck])
+    g = game(player_decks=[empty_deck], numbers_of_start_cards=(0, 0))
     player, = g.players
     start_health = 5
     player.health = start_health
 
     assert player.health == start_health
     g.start()
-    assert player.health == start_health - 1
-    g.endturn(g.current_player.id)
-    assert player.health == start_health - 3
+    # every draw from the empty deck hurts one more than the previous one
+    healths = [player.health]
     with pytest.raises(DeadPlayerError):
-        g.endturn(g.current_player.id)
-    assert player.health == 0
+        for _ in range(3):
+            g.endturn(g.current_player.id)
+            healths.append(player.health)
+    healths.append(player.health)
+    assert healths == [start_health - 1, start_health - 3, 0]
+    assert g.is_over
 
 
 def test_to_many_minions_on_board(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=1, health=2) for _ in range(10))
-    game.NUMBERS_OF_START_CARDS = (7, 0)
-    g = game(player_decks=[deck])
+    deck = Deck.from_template([WEAK_MINION] * 10)
+    g = game(player_decks=[deck], numbers_of_start_cards=(7, 0))
     player, = g.players
     player.mana = 200
     g.start()
@@ -175,8 +191,8 @@ def test_to_many_minions_on_board(game):
         g.play(player.id, last_card.id)
 
 
-def test_player_cannot_do_action_until_its_turn(game):
-    g = game()
+def test_player_cannot_do_action_until_its_turn(default_game):
+    g = default_game
     first_player, second_player = g.players
     g.start()
     card = second_player.hand[0]
@@ -186,7 +202,7 @@ def test_player_cannot_do_action_until_its_turn(game):
 
 
 def test_only_played_minion_can_attack(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=1, health=2) for _ in range(10))
+    deck = Deck.from_template([WEAK_MINION] * 10)
     g = game(player_decks=[deck, deck])
     first_player, second_player = g.players
     g.start()
@@ -201,7 +217,7 @@ def test_only_played_minion_can_attack(game):
 
 
 def test_player_cannot_attack_without_turn(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=1, health=2) for _ in range(10))
+    deck = Deck.from_template([WEAK_MINION] * 10)
     g = game(player_decks=[deck, deck])
     first_player, second_player = g.players
     g.start()
@@ -217,151 +233,83 @@ def test_player_cannot_attack_without_turn(game):
         g.attack(first_player.id, first_player_card.id, second_player_card.id)
 
 
-def test_simple_minion_attack(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=1, health=2) for _ in range(10))
-    g = game(player_decks=[deck, deck])
-    first_player, second_player = g.players
-
-    g.start()
-
-    first_player_card = first_player.hand[0]
-    g.play(first_player.id, first_player_card.id)
-    g.endturn(g.current_player.id)
-
-    second_player_card = second_player.hand[0]
-    g.play(second_player.id, second_player_card.id)
-    g.endturn(g.current_player.id)
-
-    g.attack(first_player.id, first_player_card.id, second_player_card.id)
-
-    assert first_player_card.health == 1
-    assert second_player_card.health == 1
-    assert len(g.board) == 2
+def _first_cards(g):
+    return tuple(player.hand[0] for player in g.players)
 
 
-def test_minion_removed_from_board_after_die(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=10, health=2) for _ in range(10))
+@pytest.fixture()
+def primed_attack_game(game, request):
+    # both players have played one minion from a ten-copy deck and it is the first player's turn again
+    template = getattr(request, 'param', WEAK_MINION)
+    deck = Deck.from_template([template] * 10)
     g = game(player_decks=[deck, deck])
     first_player, second_player = g.players
     g.start()
-    first_player_card = first_player.hand[0]
-    second_player_card = second_player.hand[0]
+    first_player_card, second_player_card = _first_cards(g)
 
     g.play(first_player.id, first_player_card.id)
     g.endturn(g.current_player.id)
 
     g.play(second_player.id, second_player_card.id)
     g.endturn(g.current_player.id)
+    return g, first_player, second_player, first_player_card, second_player_card
 
-    assert len(g.board) == 2
-    g.attack(first_player.id, first_player_card.id, second_player_card.id)
-    assert len(g.board) == 0
 
+@pytest.mark.parametrize('primed_attack_game, attack_player, attacks, error, expected', [
+    (WEAK_MINION, False, 1, None, (1, 1, 2)),
+    (STRONG_MINION, False, 1, None, (0, 0, 0)),
+    (WEAK_MINION, False, 2, CardCannotAttackError, (1, 1, 2)),
+    (STRONG_MINION, True, 1, None, (2, 10, 2)),
+    (STRONG_MINION, True, 2, CardCannotAttackError, (2, 10, 2)),
+    (KILLER_MINION, True, 1, DeadPlayerError, (2, 0, 2)),
+], ids=[
+    'simple_minion_attack',
+    'minion_removed_from_board_after_die',
+    'minion_cannot_attack_twice',
+    'attack_player',
+    'attack_player_twice_with_same_card',
+    'kill_player',
+], indirect=['primed_attack_game'])
+def test_minion_attack(primed_attack_game, attack_player, attacks, error, expected):
+    g, first_player, second_player, first_player_card, second_player_card = primed_attack_game
+    victim = second_player if attack_player else second_player_card
 
-def test_simple_minion_cannot_attack_in_played_turn(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=10, health=2) for _ in range(10))
-    g = game(player_decks=[deck, deck])
-    first_player, second_player = g.players
-    g.start()
-    first_player_card = first_player.hand[0]
-    second_player_card = second_player.hand[0]
-
-    g.play(first_player.id, first_player_card.id)
-    g.endturn(g.current_player.id)
+    for _ in range(attacks - 1):
+        g.attack(first_player.id, first_player_card.id, victim.id)
+    with pytest.raises(error) if error else nullcontext():
+        g.attack(first_player.id, first_player_card.id, victim.id)
 
-    g.play(second_player.id, second_player_card.id)
-    with pytest.raises(CardCannotAttackError):
-        g.attack(second_player.id, second_player_card.id, first_player_card.id)
+    assert (first_player_card.health, victim.health, len(g.board)) == expected
 
 
-def test_minon_cannot_attack_twice(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=1, health=2) for _ in range(10))
+def test_simple_minion_cannot_attack_in_played_turn(game):
+    deck = Deck.from_template([STRONG_MINION] * 10)
     g = game(player_decks=[deck, deck])
     first_player, second_player = g.players
     g.start()
-    first_player_card = first_player.hand[0]
-    second_player_card = second_player.hand[0]
+    first_player_card, second_player_card = _first_cards(g)
 
     g.play(first_player.id, first_player_card.id)
     g.endturn(g.current_player.id)
 
     g.play(second_player.id, second_player_card.id)
-    g.endturn(g.current_player.id)
-
-    g.attack(first_player.id, first_player_card.id, second_player_card.id)
     with pytest.raises(CardCannotAttackError):
-        g.attack(first_player.id, first_player_card.id, second_player_card.id)
-
-
-def test_attack_player(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=10, health=2) for _ in range(10))
-    g = game(player_decks=[deck, deck])
-    first_player, second_player = g.players
-    g.start()
-    first_player_card = first_player.hand[0]
-    second_player_card = second_player.hand[0]
-
-    g.play(first_player.id, first_player_card.id)
-    g.endturn(g.current_player.id)
-
-    g.play(second_player.id, second_player_card.id)
-    g.endturn(g.current_player.id)
-
-    assert second_player.health == 20
-    g.attack(first_player.id, first_player_card.id, second_player.id)
-    assert second_player.health == 10
-
-
-def test_attack_player_not_in_turn(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=1, health=2) for _ in range(10))
-    g = game(player_decks=[deck, deck])
-    first_player, second_player = g.players
-    g.start()
-    first_player_card = first_player.hand[0]
-    second_player_card = second_player.hand[0]
-
-    g.play(first_player.id, first_player_card.id)
-    g.endturn(g.current_player.id)
+        g.attack(second_player.id, second_player_card.id, first_player_card.id)
 
-    g.play(second_player.id, second_player_card.id)
-    g.endturn(g.current_player.id)
 
+def test_attack_player_not_in_turn(primed_attack_game):
+    g, first_player, second_player, first_player_card, _ = primed_attack_game
     g.endturn(g.current_player.id)
     with pytest.raises(InvalidPlayerTurnError):
         g.attack(first_player.id, first_player_card.id, second_player.id)
 
 
-def test_attack_player_twice_with_same_card(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=10, health=2) for _ in range(10))
-    g = game(player_decks=[deck, deck])
-    first_player, second_player = g.players
-    g.start()
-    first_player_card = first_player.hand[0]
-    second_player_card = second_player.hand[0]
-
-    g.play(first_player.id, first_player_card.id)
-    g.endturn(g.current_player.id)
-
-    g.play(second_player.id, second_player_card.id)
-    g.endturn(g.current_player.id)
-
-    assert second_player.health == 20
-    g.attack(first_player.id, first_player_card.id, second_player.id)
-    assert second_player.health == 10
-
-    with pytest.raises(CardCannotAttackError):
-        g.attack(first_player.id, first_player_card.id, second_player.id)
-
-    assert second_player.health == 10
-
-
 def test_attack_player_not_played_card(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=1, health=2) for _ in range(10))
+    deck = Deck.from_template([WEAK_MINION] * 10)
     g = game(player_decks=[deck, deck])
     first_player, second_player = g.players
     g.start()
-    first_player_card = first_player.hand[0]
-    second_player_card = second_player.hand[0]
+    first_player_card, second_player_card = _first_cards(g)
 
     g.endturn(g.current_player.id)
 
@@ -372,32 +320,12 @@ def test_attack_player_not_played_card(game):
         g.attack(first_player.id, first_player_card.id, second_player.id)
 
 
-def test_kill_player(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=50, health=2) for _ in range(10))
-    g = game(player_decks=[deck, deck])
-    first_player, second_player = g.players
-    g.start()
-    first_player_card = first_player.hand[0]
-    second_player_card = second_player.hand[0]
-
-    g.play(first_player.id, first_player_card.id)
-    g.endturn(g.current_player.id)
-
-    g.play(second_player.id, second_player_card.id)
-    g.endturn(g.current_player.id)
-
-    assert second_player.health == 20
-    with pytest.raises(DeadPlayerError):
-        g.attack(first_player.id, first_player_card.id, second_player.id)
-
-
 def test_minion_card_charge_ability_attack_card(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=10, health=2, ability=ChargeAbility()) for _ in range(10))
+    deck = Deck.from_template([CHARGE_MINION] * 10)
     g = game(player_decks=[deck, deck])
     first_player, second_player = g.players
     g.start()
-    first_player_card = first_player.hand[0]
-    second_player_card = second_player.hand[0]
+    first_player_card, second_player_card = _first_cards(g)
 
     g.play(first_player.id, first_player_card.id)
     g.endturn(g.current_player.id)
@@ -407,12 +335,11 @@ def test_minion_card_charge_ability_attack_card(game):
 
 
 def test_minion_card_charge_ability_attack_player(game):
-    deck = Deck(MinionCard(name='test', cost=1, attack=10, health=2, ability=ChargeAbility()) for _ in range(10))
+    deck = Deck.from_template([CHARGE_MINION] * 10)
     g = game(player_decks=[deck, deck])
     first_player, second_player = g.players
     g.start()
-    first_player_card = first_player.hand[0]
-    second_player_card = second_player.hand[0]
+    first_player_card, second_player_card = _first_cards(g)
 
     g.play(first_player.id, first_player_card.id)
     g.endturn(g.current_player.id)
@@ -422,9 +349,8 @@ def test_minion_card_charge_ability_attack_player(game):
 
 
 def test_minion_card_increase_attack_ability(game):
-    deck = Deck(
-        MinionCard(name='test', cost=1, attack=1, health=2, ability=IncreaseDamageAbility(10)) for _ in range(10)
-    )
+    template = MinionCard(name='test', cost=1, attack=1, health=2, ability=IncreaseDamageAbility(10))
+    deck = Deck.from_template([template] * 10)
     g = game(player_decks=[deck, deck])
     first_player, _ = g.players
     g.start()
@@ -504,13 +430,12 @@ def test_increase_health_and_damage_spell_no_target(game):
 
 
 def test_deal_damage_spell(game):
-    game.NUMBERS_OF_START_CARDS = (1, 0)
     deck = Deck([
         MinionCard(name='minon 1', cost=0, attack=50, health=2),
         MinionCard(name='minon 2', cost=0, attack=50, health=12),
         AbilityCard(name='spell', cost=1, ability=DealDamage(10)),
     ])
-    g = game(player_decks=[deck, deck])
+    g = game(player_decks=[deck, deck], numbers_of_start_cards=(1, 0))
 
     first_player, second_player = g.players
     g.start()
@@ -527,13 +452,12 @@ def test_deal_damage_spell(game):
 
 
 def test_deal_damage_spell_minion(game):
-    game.NUMBERS_OF_START_CARDS = (1, 0)
     deck = Deck([
         MinionCard(name='minon 1', cost=0, attack=50, health=2),
         MinionCard(name='minon 2', cost=0, attack=50, health=12),
         MinionCard(name='minion with ability', cost=1, attack=50, health=2, ability=DealDamage(10, allow_target=True)),
     ])
-    g = game(player_decks=[deck, deck])
+    g = game(player_decks=[deck, deck], numbers_of_start_cards=(1, 0))
 
     first_player, second_player = g.players
     g.start()
@@ -550,13 +474,12 @@ def test_deal_damage_spell_minion(game):
 
 
 def test_deal_damage_to_self_minions(game):
-    game.NUMBERS_OF_START_CARDS = (2, 0)
     deck = Deck([
         MinionCard(name='minon 1', cost=0, attack=50, health=2),
         MinionCard(name='minon 2', cost=0, attack=50, health=12),
         MinionCard(name='minion with ability', cost=1, attack=50, health=2, ability=DealDamage(10, allow_target=True)),
     ])
-    g = game(player_decks=[deck, deck])
+    g = game(player_decks=[deck, deck], numbers_of_start_cards=(2, 0))
 
     first_player, second_player = g.players
     g.start()
@@ -566,3 +489,107 @@ def test_deal_damage_to_self_minions(game):
 
     with pytest.raises(InvalidTargetError):
         g.play(first_player.id, first_player_card_3.id, first_player_card_2.id)
+
+
+@pytest.mark.parametrize('primed_attack_game', [STRONG_MINION], indirect=True)
+def test_restore_game_snapshot(primed_attack_game):
+    g, first_player, second_player, first_player_card, second_player_card = primed_attack_game
+    snapshot = g.snapshot()
+    g.attack(first_player.id, first_player_card.id, second_player_card.id)
+    g.endturn(g.current_player.id)
+    assert len(g.board) == 0
+
+    g.restore(snapshot)
+    assert len(g.board) == 2
+    assert g.current_player == first_player
+    assert first_player_card.health == second_player_card.health == 2
+    assert first_player_card.can_attack
+    assert len(second_player.hand) == 4
+    g.attack(first_player.id, first_player_card.id, second_player.id)
+    assert second_player.health == 10
+
+
+def test_game_copy_is_independent(game):
+    deck = Deck.from_template([MinionCard(name='test', cost=1, attack=1, health=2, ability=ChargeAbility())] * 10)
+    g = game(player_decks=[deck, deck])
+    first_player, second_player = g.players
+    g.start()
+    card = first_player.hand[0]
+    g.play(first_player.id, card.id)
+
+    copied_game = g.copy()
+    copied_player, copied_enemy = copied_game.players
+    copied_card, = copied_game.board.played_cards(copied_player)
+    assert copied_card is not card
+    assert copied_card.ability is card.ability
+    assert copied_player.deck is copied_enemy.deck
+
+    copied_game.attack(copied_player.id, copied_card.id, copied_enemy.id)
+    assert copied_enemy.health == 19
+    assert second_player.health == 20
+    assert card.can_attack
+
+
+def test_can_play_and_attack_checks(game):
+    deck = Deck.from_template([WEAK_MINION] * 10)
+    g = game(player_decks=[deck, deck])
+    first_player, second_player = g.players
+    card = first_player.hand[0]
+    assert not g.can_play(first_player, card)
+
+    g.start()
+    assert g.can_play(first_player, card)
+    assert not g.can_play(first_player, card, target=second_player.hand[0])
+    assert not g.can_play(second_player, second_player.hand[0])
+
+    g.play(first_player.id, card.id)
+    assert not g.can_play(first_player, card)
+    assert not g.can_attack(first_player, card, second_player)
+
+    g.endturn(first_player.id)
+    g.endturn(second_player.id)
+    assert g.can_attack(first_player, card, second_player)
+    assert not g.can_attack(first_player, card, second_player.hand[0])
+
+
+def test_board_keeps_cards_after_removing_one(game):
+    deck = Deck.from_template([MinionCard(name='test', cost=0, attack=1, health=1)] * 10)
+    g = game(player_decks=[deck, deck])
+    first_player, second_player = g.players
+    g.start()
+
+    first_card, second_card, third_card = first_player.hand[:3]
+    for card in (first_card, second_card, third_card):
+        g.play(first_player.id, card.id)
+    g.endturn(first_player.id)
+
+    victim = second_player.hand[0]
+    g.play(second_player.id, victim.id)
+    g.endturn(second_player.id)
+
+    g.attack(first_player.id, first_card.id, victim.id)
+    assert set(g.board.played_cards(first_player)) == {second_card, third_card}
+    assert g.board.get_card(third_card.id, first_player) is third_card
+    assert g.board.get_card(second_card.id, first_player) is second_card
+    with pytest.raises(MissingCardError):
+        g.board.get_card(first_card.id, first_player)
+
+
+def test_cloned_card_has_own_identity():
+    card = MinionCard(name='test', cost=1, attack=1, health=2, ability=ChargeAbility())
+    clone = card.clone()
+
+    assert clone.id != card.id
+    assert clone != card
+    assert (clone.cost, clone.damage, clone.health, clone.can_attack) == (1, 1, 2, True)
+    assert clone.ability is card.ability
+
+    clone.health = 1
+    assert card.health == 2
+
+
+def test_equal_abilities_are_shared():
+    assert ChargeAbility() is ChargeAbility()
+    assert DealDamage(2, allow_target=True) is DealDamage(2, allow_target=True)
+    assert DealDamage(2) is not DealDamage(2, allow_target=True)
+    assert DealDamage(2) is not DealDamage(4)
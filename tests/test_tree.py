@@ -1,9 +1,16 @@
-from pyheart.tree import GameTree, Node, ActionGenerator
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+from pyheart.cards import Deck, MinionCard, ChargeAbility
+from pyheart.tree import (
+    _root_visits, GameTree, Node, ActionGenerator, AttackNode, EndTurnNode, PlayCartNode, NonDeterministicPlayCartNode)
 
 
 class UniqueNode(Node):
-    def __hash__(self):
-        return hash(self.__class__) ^ hash(id(self))
+    def __init__(self):
+        super(UniqueNode, self).__init__()
+        self._set_key(UniqueNode, id(self))
 
 
 def test_create_tree():
@@ -21,6 +28,42 @@ def test_create_tree():
     assert tree.height == 2
 
 
+def test_leaves_do_not_share_added_children():
+    first, second = UniqueNode(), UniqueNode()
+    first.add_child(UniqueNode())
+
+    assert len(first.children) == 1
+    assert len(second.children) == 0
+    assert second.is_leaf
+    with pytest.raises(TypeError):
+        second.children.add(UniqueNode())
+    with pytest.raises(TypeError):
+        second.children.append(UniqueNode())
+    assert len(UniqueNode().children) == 0
+
+
+def test_children_with_colliding_hashes_are_kept():
+    class CollidingNode(UniqueNode):
+        def __hash__(self):
+            return 0
+
+    node = UniqueNode()
+    first, second = CollidingNode(), CollidingNode()
+
+    assert node.add_child(first)
+    assert node.add_child(second)
+    assert not node.add_child(first)
+    assert second in node.children
+
+
+def test_counters_follow_search():
+    tree = GameTree()
+    tree.run(100)
+
+    assert tree.nodes == tree.root.nodes
+    assert tree.height == tree.root.height
+
+
 def test_tree_policy():
     tree = GameTree()
 
@@ -72,3 +115,202 @@ def test_root_wins_losses_propagation():
     losses = sum(tree.root.children.losses)
     assert wins == tree.root.wins or wins + 1 == tree.root.wins
     assert losses == tree.root.losses or losses + 1 == tree.root.losses
+
+
+def test_play_keeps_subtree_statistics():
+    tree = GameTree()
+    tree.run(10)
+    best_action = tree.best_action
+    visits, wins, losses = best_action.visits, best_action.wins, best_action.losses
+
+    tree.play(best_action)
+    assert tree.root is best_action
+    assert (tree.root.visits, tree.root.wins, tree.root.losses) == (visits, wins, losses)
+    assert len(tree._visits) == tree.nodes
+
+
+def test_search_continues_after_several_plays():
+    tree = GameTree()
+    for _ in range(6):
+        move = tree.run(20)
+        if move.is_terminal:
+            break
+        tree.play(move)
+
+    assert tree.nodes == tree.root.nodes
+
+
+def test_node_path_after_play():
+    tree = GameTree()
+    tree.run(5)
+    new_root = tree.root.children[0]
+    leaf = new_root.children[0] if new_root.children else new_root
+    assert list(leaf.path)[-1] is tree.root
+    assert leaf.depth == sum(1 for _ in leaf.path) - 1
+
+    tree.play(new_root)
+    assert list(leaf.path)[-1] is new_root
+    assert leaf.depth == sum(1 for _ in leaf.path) - 1
+
+
+def test_node_score_follows_wins_and_losses():
+    tree = GameTree()
+    tree.run(10)
+
+    for node in [tree.root, *tree.root.children]:
+        total_games = node.wins + node.losses
+        assert node.score == (node.wins / total_games if total_games else 0)
+
+
+def test_nodes_of_different_types_are_not_equal():
+    class OtherNode(Node):
+        pass
+
+    assert Node() == Node()
+    assert Node() != OtherNode()
+
+
+def test_run_with_batched_leaves():
+    tree = GameTree()
+    tree.run(12, batch_size=4)
+
+    assert tree.root.visits == 12
+    assert sum(tree.root.children.visits) == 12
+
+
+def test_forced_win_is_backed_up():
+    tree = GameTree()
+    winning_move = EndTurnNode(tree.player)
+    winning_move.is_terminal = True
+    tree.root.add_child(winning_move)
+
+    tree.backup(winning_move, 1)
+    assert winning_move.forced_reward == 1
+    assert tree.root.forced_reward == 1
+    assert tree.tree_policy() is tree.root
+    assert tree.default_policy(tree.root) == 1
+
+
+def test_winning_action_is_expanded_first(game):
+    deck = Deck([
+        MinionCard('killer', cost=0, attack=50, health=1, ability=ChargeAbility()),
+        MinionCard('test minion', cost=0, attack=1, health=1),
+        MinionCard('test minion 2', cost=0, attack=1, health=1),
+    ])
+    g = game(player_decks=[deck, deck], numbers_of_start_cards=(2, 0))
+    g.start()
+    player = g.current_player
+    killer, = (card for card in player.hand if card.name == 'killer')
+    g.play(player.id, killer.id)
+    tree = GameTree(g)
+
+    winning_move = tree.tree_policy()
+    assert isinstance(winning_move, AttackNode)
+    assert winning_move.forced_reward == 1
+    assert tree.root.forced_reward is None
+    tree.backup(winning_move, 1)
+    assert tree.root.forced_reward == 1
+
+
+def test_transposed_nodes_share_statistics():
+    tree = GameTree()
+    tree.run(100)
+
+    states = {}
+    queue = [tree.root]
+    while queue:
+        node = queue.pop()
+        queue.extend(node.children)
+        if not node.is_terminal:
+            state = tree.reply_game(node).state_key()
+            assert states.setdefault(node.idx, state) == state
+
+
+def test_play_orders_reaching_one_state_share_statistics(game):
+    deck = Deck([MinionCard('test minion', cost=0, attack=1, health=1) for _ in range(4)])
+    g = game(player_decks=[deck, deck], numbers_of_start_cards=(2, 0))
+    g.start()
+    tree = GameTree(g)
+    first_card, second_card = tree.player.hand[:2]
+
+    def add(parent, card):
+        action = PlayCartNode(tree.player, card)
+        tree._transpose(tree.reply_game(parent), action)
+        parent.add_child(action)
+        return action
+
+    first_then_second = add(add(tree.root, first_card), second_card)
+    second_then_first = add(add(tree.root, second_card), first_card)
+    assert first_then_second.idx == second_then_first.idx
+
+    tree.backup(first_then_second, 1)
+    assert second_then_first.visits == 1
+
+
+def test_play_nodes_compare_by_ids():
+    tree = GameTree()
+    player = tree.player
+    first_card, second_card = player.hand[:2]
+    copied_player = tree.game.copy().player_by_id(player.id)
+
+    assert PlayCartNode(player, first_card) == PlayCartNode(copied_player, first_card)
+    assert PlayCartNode(player, first_card) == NonDeterministicPlayCartNode(0.5, player, first_card)
+    assert PlayCartNode(player, first_card) != PlayCartNode(player, second_card)
+    assert PlayCartNode(player, first_card) != EndTurnNode(player)
+
+
+def test_run_with_process_pool():
+    tree = GameTree()
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        tree.run(8, batch_size=4, executor=executor)
+
+    assert tree.root.visits == 8
+
+
+def test_search_parallel():
+    tree = GameTree()
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        action = tree.search_parallel(executor, workers=2, iterations=20)
+
+    assert action.player == tree.player
+    action.apply(tree.game.copy())
+
+
+def test_root_votes_ignore_forced_rewards():
+    tree = GameTree()
+    proven = EndTurnNode(tree.player)
+    proven.is_terminal = True
+    tree.root.add_child(proven)
+    tree.backup(proven, 1)
+
+    other_tree = GameTree(tree.game)
+    unproven = EndTurnNode(other_tree.player)
+    other_tree.root.add_child(unproven)
+    other_tree.backup(unproven, 1)
+
+    assert proven.descriptor != unproven.descriptor
+    assert tree._root_votes() == other_tree._root_votes()
+
+
+def test_root_search_leaves_global_random_alone():
+    tree = GameTree()
+    state = random.getstate()
+    # a cache miss enumerates candidates with the tree's rng, so both runs start from an empty cache
+    ActionGenerator.clear_cache()
+    votes = _root_visits(tree.game, 20, seed=1)
+
+    assert sum(votes.values()) == 20
+    assert random.getstate() == state
+    ActionGenerator.clear_cache()
+    assert _root_visits(tree.game, 20, seed=1) == votes
+
+
+def test_rollout_batch_averages_playouts():
+    tree = GameTree()
+    game = tree.reply_game(tree.root)
+    state = game.state_key()
+    reward = tree.rollout_batch(game, 4)
+
+    assert -1 <= reward <= 1
+    assert reward * 4 == int(reward * 4)
+    assert game.state_key() == state